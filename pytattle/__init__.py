@@ -208,7 +208,7 @@ class Error(Serializable):
     """
     
     fingerprint_fields = (
-        'pacakge_name', 'module_name', 'method_name', 'exc_type', 'exc_message')
+        'package_name', 'module_name', 'method_name', 'exc_type', 'exc_message')
     
     def __init__(
             self, application_metadata, system_metadata, lineno, package_name, 
@@ -220,9 +220,23 @@ class Error(Serializable):
         """Convert this error to a hash based on invariant information. Used
         for matching against already reported errors.
         """
+        return self.fingerprint_from(dict(
+            (field, getattr(self, field)) for field in self.fingerprint_fields))
+    
+    @classmethod
+    def fingerprint_from(cls, fields):
+        """Compute the fingerprint of a serialized error.
+        
+        Args:
+            fields: A mapping of field name to value; missing fields are
+                treated as None.
+        
+        Returns:
+            The fingerprint (hex string).
+        """
         sha = hashlib.sha256()
-        for field in self.fingerprint_fields):
-            sha.update(str(getattr(self, field)).encode())
+        for field in cls.fingerprint_fields:
+            sha.update(str(fields.get(field)).encode())
         return sha.hexdigest()
 
 class ErrorFactory(Serializable):
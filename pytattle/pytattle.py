@@ -116,7 +116,7 @@ class PyTattle(object):
         except:
             err = sys.exc_info()
             if self.redirect == "ftp":
-                self._send_ftp_traceback(err)
+                self._send_ftp_traceback(err[1])
             sys.exit()
 
     def _error_report(self, trace_back):
@@ -170,9 +170,15 @@ class PyTattle(object):
         return message
 
     def _send_ftp_traceback(self, e):
+        tb = self._format_traceback(e)
+        print("\033[mYour program has crashed with the following traceback:\033[91m\n\n%s\n\n\033[m" % tb)
+        self._error_report(tb)
+        return
+
+    def _format_traceback(self, e):
         now = datetime.datetime.now()
         tb = ""
-        for _line in traceback.format_tb(sys.exc_info()[2]):
+        for _line in traceback.format_tb(e.__traceback__):
             if os.name == "nt":
                 _line = re.sub('"(?:[A-Za-z]:)*\{0}.*\{0}(.*)?"'.format(os.sep), r'"\1"', _line)
             else:
@@ -183,10 +189,7 @@ class PyTattle(object):
         date = "# Date: %s\n\n" % now.strftime('%Y-%m-%d')
         error = "%s: %s\n\n" % (type(e).__name__, e)
 
-        tb = "".join([python, platform, date, error, tb])
-        print("\033[mYour program has crashed with the following traceback:\033[91m\n\n%s\n\n\033[m" % tb)
-        self._error_report(tb)
-        return
+        return "".join([python, platform, date, error, tb])
 
 
 def main_function(arg1, arg2, doing="something not that important!"):
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the offline report viewer
+"""
+
+import json
+import re
+import pytest
+from pytattle import Error, viewer
+from pytattle.pytattle import PyTattle
+
+
+def crash():
+    return 1 / 0
+
+
+def text_report():
+    """Generate a plain-text report with the FTP reporter, dated 2017-03-27.
+    """
+    try:
+        crash()
+    except ZeroDivisionError as err:
+        report = PyTattle()._format_traceback(err)
+    return re.sub('# Date: .*', '# Date: 2017-03-27', report)
+
+
+def write_json_report(path, exc_message, timestamp):
+    error = dict(
+        package_name='pkg', module_name='mod', method_name='func',
+        exc_type='ValueError', exc_message=exc_message, timestamp=timestamp)
+    with open(str(path), 'wt') as out:
+        json.dump(dict(user={}, error=error, results={}), out)
+
+
+@pytest.fixture
+def report_dir(tmpdir):
+    reports = tmpdir.mkdir('reports')
+    write_json_report(reports.join('a.json'), 'bad', '2017-03-27T10:15:00')
+    write_json_report(reports.join('b.json'), 'bad', '2017-03-28T11:00:00')
+    write_json_report(reports.join('c.json'), 'worse', 1490609700)
+    reports.join('d.txt').write(text_report())
+    reports.join('e.txt').write('garbage')
+    return reports
+
+
+def test_parse_text_report():
+    report = text_report()
+    fields = viewer.parse_report(report)
+    assert fields['exc_type'] == 'ZeroDivisionError'
+    assert fields['exc_message'] == 'division by zero'
+    assert fields['module_name'] == 'test_viewer.py'
+    assert fields['method_name'] == 'crash'
+    assert fields['timestamp'] == '2017-03-27 00:00:00'
+    assert viewer.parse_report(report)['fingerprint'] == fields['fingerprint']
+    assert viewer.parse_report('garbage') is None
+    assert viewer.parse_report(
+        'Notes\n=====\n\nTODO: triage crash storm\n') is None
+
+
+def test_normalize_timestamp():
+    assert viewer.normalize_timestamp(1490609700) == '2017-03-27 10:15:00'
+    assert viewer.normalize_timestamp(
+        '2017-03-27T10:15') == '2017-03-27 10:15:00'
+    assert viewer.normalize_timestamp(
+        '2017-03-27T10:15:00.123+02:00') == '2017-03-27 08:15:00'
+    assert viewer.normalize_timestamp(
+        '2017-03-27 23:30-0130') == '2017-03-28 01:00:00'
+    assert viewer.normalize_timestamp(
+        '2017-03-27T10:15:00Z') == '2017-03-27 10:15:00'
+    for value in (1490609700000, float('inf'), float('nan'), 'soon', None,
+                  '2017-13-45', '2017-02-29', '2017-03-27 25:00'):
+        assert viewer.normalize_timestamp(value) is None
+
+
+def test_index_invalid_date(tmpdir):
+    reports = tmpdir.mkdir('reports')
+    write_json_report(reports.join('a.json'), 'bad', '2017-13-45')
+    with viewer.ReportIndex(str(tmpdir.join('db'))) as report_index:
+        report_index.index(str(reports))
+        assert all(
+            bucket is not None for bucket, _ in report_index.timeline())
+
+
+def test_index_bad_epoch(tmpdir):
+    reports = tmpdir.mkdir('reports')
+    write_json_report(reports.join('a.json'), 'bad', 1490609700000)
+    with viewer.ReportIndex(str(tmpdir.join('db'))) as report_index:
+        assert report_index.index(str(reports)) == (1, 0, 0, 0)
+        assert next(report_index.summary())['first_seen'] is not None
+
+
+def test_index_non_scalar_fields(tmpdir):
+    reports = tmpdir.mkdir('reports')
+    write_json_report(reports.join('a.json'), ['a'], '2017-03-27')
+    write_json_report(reports.join('b.json'), {'a': 1}, '2017-03-27')
+    with viewer.ReportIndex(str(tmpdir.join('db'))) as report_index:
+        assert report_index.index(str(reports)) == (2, 0, 0, 0)
+        assert sorted(
+            group['exc_message'] for group in report_index.summary()) == [
+                "['a']", "{'a': 1}"]
+
+
+def test_index_utf8(tmpdir):
+    reports = tmpdir.mkdir('reports')
+    report = json.dumps(dict(error=dict(
+        exc_type='ValueError', exc_message='caf\u00e9',
+        timestamp='2017-03-27')), ensure_ascii=False)
+    reports.join('a.json').write_binary(report.encode('utf-8'))
+    reports.join('b.json').write_binary(
+        b'\xef\xbb\xbf' + report.encode('utf-8'))
+    with viewer.ReportIndex(str(tmpdir.join('db'))) as report_index:
+        assert report_index.index(str(reports)) == (2, 0, 0, 0)
+        groups = list(report_index.summary())
+        assert len(groups) == 1
+        assert groups[0]['exc_message'] == 'caf\u00e9'
+
+
+def test_index_ignores_supplied_fingerprint(tmpdir):
+    reports = tmpdir.mkdir('reports')
+    for name, exc_message in (('a.json', 'bad'), ('b.json', 'worse')):
+        reports.join(name).write(json.dumps(dict(error=dict(
+            exc_type='ValueError', exc_message=exc_message,
+            fingerprint='abc'))))
+    with viewer.ReportIndex(str(tmpdir.join('db'))) as report_index:
+        report_index.index(str(reports))
+        groups = list(report_index.summary())
+        assert sorted(group['exc_message'] for group in groups) == [
+            'bad', 'worse']
+        for group in groups:
+            assert group['fingerprint'] == Error.fingerprint_from(group)
+
+
+def test_index_incremental(tmpdir, report_dir):
+    with viewer.ReportIndex(str(tmpdir.join('db'))) as report_index:
+        assert report_index.index(str(report_dir)) == (4, 0, 1, 0)
+        assert report_index.index(str(report_dir)) == (0, 5, 0, 0)
+        write_json_report(report_dir.join('f.json'), 'bad', '2017-03-29')
+        assert report_index.index(str(report_dir)) == (1, 5, 0, 0)
+
+        # Modified files are re-indexed, replacing the previous row
+        modified = report_dir.join('c.json')
+        write_json_report(modified, 'bad', '2017-03-30')
+        modified.setmtime(modified.mtime() + 10)
+        assert report_index.index(str(report_dir)) == (1, 5, 0, 0)
+        groups = list(report_index.summary())
+        assert [group['count'] for group in groups] == [4, 1]
+        assert groups[0]['last_seen'] == '2017-03-30 00:00:00'
+
+
+def test_index_removed(tmpdir, report_dir):
+    other = tmpdir.mkdir('reports2')
+    write_json_report(other.join('a.json'), 'other', '2017-03-27')
+    with viewer.ReportIndex(str(tmpdir.join('db'))) as report_index:
+        report_index.index(str(report_dir))
+        report_index.index(str(other))
+        report_dir.join('a.json').remove()
+        report_dir.join('e.txt').remove()
+        assert report_index.index(str(report_dir)) == (0, 3, 0, 2)
+        assert sum(group['count'] for group in report_index.summary()) == 4
+        assert report_index.index(str(other)) == (0, 1, 0, 0)
+
+
+def test_index_missing_directory(tmpdir, report_dir, capsys):
+    with viewer.ReportIndex(str(tmpdir.join('db'))) as report_index:
+        report_index.index(str(report_dir))
+        report_dir.rename(tmpdir.join('moved'))
+        for path in (report_dir, tmpdir.join('db')):
+            with pytest.raises(ValueError):
+                report_index.index(str(path))
+        assert sum(group['count'] for group in report_index.summary()) == 4
+    with pytest.raises(SystemExit):
+        viewer.main(['--db', str(tmpdir.join('db')), 'index', str(report_dir)])
+    assert 'not a directory' in capsys.readouterr()[1]
+
+
+def test_index_unreadable_subdirectory(tmpdir, report_dir, monkeypatch):
+    report_dir.mkdir('sub').join('a.json').write('{}')
+    with viewer.ReportIndex(str(tmpdir.join('db'))) as report_index:
+        report_index.index(str(report_dir))
+        walk = viewer.os.walk
+
+        def failing_walk(top, onerror=None):
+            for entry in walk(top, onerror=onerror):
+                if entry[0].endswith('sub'):
+                    onerror(OSError(13, 'Permission denied', entry[0]))
+                else:
+                    yield entry
+
+        monkeypatch.setattr(viewer.os, 'walk', failing_walk)
+        assert report_index.index(str(report_dir)) == (0, 5, 0, 0)
+
+
+def test_index_skips_own_db(report_dir):
+    with viewer.ReportIndex(str(report_dir.join('db'))) as report_index:
+        assert report_index.index(str(report_dir)) == (4, 0, 1, 0)
+        assert report_index.index(str(report_dir)) == (0, 5, 0, 0)
+
+
+def test_summary_and_timeline(tmpdir, report_dir):
+    with viewer.ReportIndex(str(tmpdir.join('db'))) as report_index:
+        report_index.index(str(report_dir))
+        groups = list(report_index.summary())
+        assert [group['count'] for group in groups] == [2, 1, 1]
+        top = groups[0]
+        assert top['exc_message'] == 'bad'
+        assert top['first_seen'] == '2017-03-27 10:15:00'
+        assert top['last_seen'] == '2017-03-28 11:00:00'
+        assert top['fingerprint'] == Error.fingerprint_from(top)
+        assert list(report_index.summary(limit=1)) == groups[:1]
+        assert len(list(report_index.summary(since='2017-03-28'))) == 1
+
+        timeline = report_index.timeline(fingerprint=top['fingerprint'][:8])
+        assert list(timeline) == [('2017-03-27', 1), ('2017-03-28', 1)]
+        assert list(report_index.timeline('month')) == [('2017-03', 4)]
+        with pytest.raises(ValueError):
+            list(report_index.timeline('week'))
+        for kwargs in (dict(since='yesterday'), dict(until='garbage')):
+            with pytest.raises(ValueError):
+                list(report_index.summary(**kwargs))
+            with pytest.raises(ValueError):
+                list(report_index.timeline(**kwargs))
+
+
+def test_main_invalid_since(tmpdir, capsys):
+    with pytest.raises(SystemExit):
+        viewer.main(['--db', str(tmpdir.join('db')), 'summary',
+                     '--since', 'yesterday'])
+    assert 'invalid date' in capsys.readouterr()[1]
+
+
+def test_main_export(tmpdir, report_dir, capsys):
+    db = str(tmpdir.join('db'))
+    viewer.main(['--db', db, 'index', str(report_dir)])
+    assert 'indexed 4' in capsys.readouterr()[0]
+    output = tmpdir.join('summary.json')
+    viewer.main(['--db', db, 'export', '--format', 'json', '-o', str(output)])
+    groups = json.loads(output.read())
+    assert sum(group['count'] for group in groups) == 4
+    viewer.main(['--db', db, 'export'])
+    lines = capsys.readouterr()[0].splitlines()
+    assert lines[0].split(',') == list(viewer.SUMMARY_COLUMNS)
+    assert len(lines) == 4
@@ -0,0 +1,471 @@
+"""Offline viewer for spooled error reports.
+
+Report files (either JSON-serialized :class:`pytattle.Report` dicts or the
+plain-text tracebacks written by the FTP reporter) are indexed into a local
+SQLite database, which can then be queried without re-reading the reports.
+Indexing is incremental: files whose size and modification time are
+unchanged since the last run are skipped.
+
+Timestamps are stored in UTC. Epoch values and ISO strings with a UTC offset
+are converted; ISO strings without an offset are assumed to already be in
+UTC. Note that plain-text reports only record the (local) date of the crash,
+which is stored as-is.
+
+Usage::
+
+    pytattle index reports/
+    pytattle summary
+    pytattle timeline --bucket hour --fingerprint 3fa2...
+    pytattle export --format csv -o summary.csv
+
+(or equivalently ``python -m pytattle.viewer ...``).
+"""
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+from . import Error
+
+DEFAULT_DB = '.tattledb'
+
+BATCH_SIZE = 1000
+
+BUCKETS = {
+    'hour': '%Y-%m-%d %H:00',
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+    'year': '%Y'
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    fingerprint TEXT,
+    package_name TEXT,
+    module_name TEXT,
+    method_name TEXT,
+    exc_type TEXT,
+    exc_message TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS reports_fingerprint ON reports (fingerprint);
+CREATE INDEX IF NOT EXISTS reports_timestamp ON reports (timestamp);
+"""
+
+COLUMNS = (
+    'path', 'mtime', 'size', 'fingerprint', 'package_name', 'module_name',
+    'method_name', 'exc_type', 'exc_message', 'timestamp')
+
+SUMMARY_COLUMNS = (
+    'fingerprint', 'count', 'first_seen', 'last_seen', 'exc_type',
+    'exc_message', 'package_name', 'module_name', 'method_name')
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+TIMESTAMP_RE = re.compile(
+    r'(\d{4}-\d{2}-\d{2})'
+    r'(?:[ T](\d{2}:\d{2}(?::\d{2})?)(?:\.\d+)?\s*'
+    r'(Z|[+-]\d{2}:?\d{2})?)?$')
+HEADER_RE = re.compile(r'^# [^:]+: ')
+HEADER_DATE_RE = re.compile(r'^# Date: (.*)$', re.MULTILINE)
+TRACEBACK_FRAME_RE = re.compile(r'File "(.*?)", line \d+, in (\S+)')
+
+LOG = logging.getLogger(__name__)
+
+
+def normalize_timestamp(value):
+    """Convert a timestamp to a sortable UTC string ('YYYY-MM-DD HH:MM:SS').
+
+    Args:
+        value: Seconds since the epoch, or an ISO date (optionally followed
+            by a time and UTC offset).
+
+    Returns:
+        The normalized timestamp, or None if `value` could not be parsed.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return datetime.datetime.fromtimestamp(
+                value, datetime.timezone.utc).strftime(TIMESTAMP_FORMAT)
+        except (ValueError, OverflowError, OSError):
+            # e.g. millisecond timestamps, Infinity, NaN
+            return None
+    if isinstance(value, str):
+        match = TIMESTAMP_RE.match(value.strip())
+        if match:
+            date, time, offset = match.groups()
+            time = time or '00:00:00'
+            if len(time) == 5:
+                time += ':00'
+            try:
+                timestamp = datetime.datetime.strptime(
+                    '{} {}'.format(date, time), TIMESTAMP_FORMAT)
+                if offset and offset != 'Z':
+                    sign = -1 if offset[0] == '-' else 1
+                    offset = offset[1:].replace(':', '')
+                    timestamp -= sign * datetime.timedelta(
+                        hours=int(offset[:2]), minutes=int(offset[2:]))
+            except (ValueError, OverflowError):
+                # e.g. 2017-13-45
+                return None
+            return timestamp.strftime(TIMESTAMP_FORMAT)
+    return None
+
+
+def parse_report(content):
+    """Extract the indexed fields from the contents of a report file.
+
+    Args:
+        content: The report file contents (string).
+
+    Returns:
+        A dict of error fields, or None if the report could not be parsed.
+    """
+    stripped = content.lstrip()
+    if stripped.startswith('{'):
+        try:
+            report = json.loads(stripped)
+        except ValueError:
+            return None
+        error = report.get('error', report)
+        if not isinstance(error, dict):
+            return None
+        # Values are coerced to str (as in Error.as_fingerprint) so that
+        # arbitrary JSON can be bound as SQLite parameters. The fingerprint
+        # is always recomputed rather than taken from the report, so that
+        # every report in a group has the same fingerprint fields.
+        fields = dict(
+            (field, _as_str(error.get(field)))
+            for field in Error.fingerprint_fields)
+        fields['fingerprint'] = Error.fingerprint_from(fields)
+        fields['timestamp'] = normalize_timestamp(error.get('timestamp'))
+        return fields
+    return _parse_text_report(content)
+
+
+def _as_str(value):
+    return None if value is None else str(value)
+
+
+def _parse_text_report(content):
+    """Parse a plain-text report as written by
+    :meth:`pytattle.pytattle.PyTattle._send_ftp_traceback`: a block of
+    '# Key: value' header lines, the 'ExcType: message' line, then the
+    traceback. Reports written by earlier versions of the FTP reporter
+    contain the repr of the ``sys.exc_info()`` tuple in place of the
+    exception, so each of them gets a unique fingerprint.
+    """
+    blocks = re.split(r'\n\s*\n', content.strip(), maxsplit=2)
+    if len(blocks) < 2 or ':' not in blocks[1]:
+        return None
+    if not all(HEADER_RE.match(line) for line in blocks[0].splitlines()):
+        return None
+    exc_type, exc_message = (
+        part.strip() for part in blocks[1].split(':', 1))
+    fields = dict(
+        package_name=None, module_name=None, method_name=None,
+        exc_type=exc_type, exc_message=exc_message)
+    frames = TRACEBACK_FRAME_RE.findall(content)
+    if frames:
+        fields['module_name'], fields['method_name'] = frames[-1]
+    fields['fingerprint'] = Error.fingerprint_from(fields)
+    date = HEADER_DATE_RE.search(blocks[0])
+    fields['timestamp'] = normalize_timestamp(date.group(1)) if date else None
+    return fields
+
+
+class ReportIndex(object):
+    """SQLite index over a set of report files.
+
+    Args:
+        path: Path to the database file.
+    """
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        # The database and its journal files are never indexed as reports.
+        self._db_files = set(
+            os.path.abspath(path) + suffix
+            for suffix in ('', '-wal', '-shm', '-journal'))
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection.
+        """
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def index(self, directory):
+        """Index all report files under `directory`. Files that have been
+        indexed previously and have not changed since are skipped, and rows
+        for files under `directory` that no longer exist are removed.
+
+        Args:
+            directory: The directory to scan (recursively).
+
+        Returns:
+            A tuple (indexed, skipped, failed, removed) of file counts.
+
+        Raises:
+            ValueError: If `directory` is not a directory.
+        """
+        if not os.path.isdir(directory):
+            raise ValueError("Not a directory: {}".format(directory))
+        known = dict(
+            (row[0], (row[1], row[2])) for row in self.conn.execute(
+                'SELECT path, mtime, size FROM reports'))
+        indexed = skipped = failed = 0
+        seen = set()
+        walk_errors = []
+        batch = []
+        for root, _, filenames in os.walk(
+                directory, onerror=walk_errors.append):
+            for filename in filenames:
+                path = os.path.abspath(os.path.join(root, filename))
+                if path in self._db_files:
+                    continue
+                seen.add(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if known.get(path) == (stat.st_mtime, stat.st_size):
+                    skipped += 1
+                    continue
+                try:
+                    with open(path, 'rt', encoding='utf-8-sig',
+                              errors='replace') as inp:
+                        fields = parse_report(inp.read())
+                except OSError:
+                    fields = None
+                if fields is None:
+                    # Still recorded, so unparseable files are skipped on
+                    # subsequent runs.
+                    LOG.warning("Could not parse report %s", path)
+                    fields = {}
+                    failed += 1
+                else:
+                    indexed += 1
+                    if not fields['timestamp']:
+                        fields['timestamp'] = normalize_timestamp(
+                            stat.st_mtime)
+                fields.update(
+                    path=path, mtime=stat.st_mtime, size=stat.st_size)
+                batch.append(tuple(fields.get(col) for col in COLUMNS))
+                if len(batch) >= BATCH_SIZE:
+                    self._insert(batch)
+                    batch = []
+        self._insert(batch)
+        if walk_errors:
+            # Files under unreadable directories were not seen, but may
+            # still exist.
+            for err in walk_errors:
+                LOG.warning("Could not scan %s: %s", err.filename, err)
+            removed = []
+        else:
+            prefix = os.path.join(os.path.abspath(directory), '')
+            removed = [
+                (path,) for path in known
+                if path.startswith(prefix) and path not in seen]
+        # The inserts above run in an implicit transaction, which is
+        # committed here along with the deletes. Committing once per run
+        # rather than once per batch is much faster for large spools.
+        with self.conn:
+            self.conn.executemany(
+                'DELETE FROM reports WHERE path = ?', removed)
+        return indexed, skipped, failed, len(removed)
+
+    def _insert(self, rows):
+        if not rows:
+            return
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO reports ({}) VALUES ({})'.format(
+                ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))),
+            rows)
+
+    def summary(self, limit=None, since=None, until=None):
+        """Group reports by fingerprint.
+
+        Args:
+            limit: Maximum number of groups to return, or None for all.
+            since: Only count reports at or after this timestamp.
+            until: Only count reports before this timestamp.
+
+        Returns:
+            An iterator over dicts with keys :data:`SUMMARY_COLUMNS`, in
+            descending order of count.
+        """
+        where, params = self._time_filter(since, until)
+        where.append('fingerprint IS NOT NULL')
+        sql = (
+            'SELECT fingerprint, COUNT(*), MIN(timestamp), MAX(timestamp), '
+            'exc_type, exc_message, package_name, module_name, method_name '
+            'FROM reports WHERE {} GROUP BY fingerprint '
+            'ORDER BY COUNT(*) DESC, fingerprint').format(' AND '.join(where))
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        for row in self.conn.execute(sql, params):
+            yield dict(zip(SUMMARY_COLUMNS, row))
+
+    def timeline(self, bucket='day', fingerprint=None, since=None, until=None):
+        """Count reports over time.
+
+        Args:
+            bucket: The time bucket size; one of :data:`BUCKETS`.
+            fingerprint: Only count reports with this fingerprint (or any
+                fingerprint beginning with this prefix).
+            since: Only count reports at or after this timestamp.
+            until: Only count reports before this timestamp.
+
+        Returns:
+            An iterator over (bucket, count) tuples, in time order.
+        """
+        if bucket not in BUCKETS:
+            raise ValueError("Invalid bucket: {}".format(bucket))
+        where, params = self._time_filter(since, until)
+        where.append('timestamp IS NOT NULL')
+        if fingerprint:
+            where.append('fingerprint LIKE ?')
+            params.append(fingerprint + '%')
+        sql = (
+            'SELECT strftime(?, timestamp) AS bucket, COUNT(*) FROM reports '
+            'WHERE {} GROUP BY bucket ORDER BY bucket').format(
+                ' AND '.join(where))
+        return self.conn.execute(sql, [BUCKETS[bucket]] + params)
+
+    def _time_filter(self, since, until):
+        where, params = [], []
+        for value, condition in ((since, 'timestamp >= ?'),
+                                 (until, 'timestamp < ?')):
+            if value:
+                timestamp = normalize_timestamp(value)
+                if timestamp is None:
+                    raise ValueError("Invalid timestamp: {}".format(value))
+                where.append(condition)
+                params.append(timestamp)
+        return where, params
+
+
+def _directory_arg(value):
+    if not os.path.isdir(value):
+        raise argparse.ArgumentTypeError("not a directory: {}".format(value))
+    return value
+
+
+def _timestamp_arg(value):
+    timestamp = normalize_timestamp(value)
+    if timestamp is None:
+        raise argparse.ArgumentTypeError(
+            "invalid date (expected YYYY-MM-DD[ HH:MM[:SS]]): {}".format(
+                value))
+    return timestamp
+
+
+def main(args=None):
+    """Entry point for the `pytattle` command.
+    """
+    parser = argparse.ArgumentParser(
+        prog='pytattle',
+        description="Index and summarize spooled PyTattle error reports.")
+    parser.add_argument(
+        '-d', '--db', default=DEFAULT_DB,
+        help="Path to the report index database (default: %(default)s).")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    index_parser = subparsers.add_parser(
+        'index', help="Index (new or changed) report files in a directory.")
+    index_parser.add_argument('directory', nargs='+', type=_directory_arg)
+
+    def add_time_filter(subparser):
+        subparser.add_argument(
+            '--since', type=_timestamp_arg,
+            help="Only include reports on or after this date.")
+        subparser.add_argument(
+            '--until', type=_timestamp_arg,
+            help="Only include reports before this date.")
+
+    summary_parser = subparsers.add_parser(
+        'summary', help="Show report counts grouped by fingerprint.")
+    summary_parser.add_argument('-n', '--limit', type=int, default=20)
+    add_time_filter(summary_parser)
+
+    timeline_parser = subparsers.add_parser(
+        'timeline', help="Show report counts over time.")
+    timeline_parser.add_argument(
+        '-b', '--bucket', choices=sorted(BUCKETS), default='day')
+    timeline_parser.add_argument(
+        '-f', '--fingerprint', help="Fingerprint (or prefix) to count.")
+    add_time_filter(timeline_parser)
+
+    export_parser = subparsers.add_parser(
+        'export', help="Export the fingerprint summary.")
+    export_parser.add_argument(
+        '--format', choices=('csv', 'json'), default='csv')
+    export_parser.add_argument(
+        '-o', '--output', default='-', help="Output file (default: stdout).")
+    add_time_filter(export_parser)
+
+    args = parser.parse_args(args)
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+
+    try:
+        with ReportIndex(args.db) as report_index:
+            if args.command == 'index':
+                for directory in args.directory:
+                    indexed, skipped, failed, removed = report_index.index(
+                        directory)
+                    print("{}: indexed {}, skipped {} unchanged, {} failed, "
+                          "removed {}".format(
+                              directory, indexed, skipped, failed, removed))
+            elif args.command == 'summary':
+                for group in report_index.summary(
+                        args.limit, args.since, args.until):
+                    print("{count:>8}  {fingerprint:.12}  {first_seen} - "
+                          "{last_seen}  {exc_type}: {exc_message}".format(
+                              **group))
+            elif args.command == 'timeline':
+                for bucket, count in report_index.timeline(
+                        args.bucket, args.fingerprint, args.since, args.until):
+                    print("{}\t{}".format(bucket, count))
+            elif args.command == 'export':
+                groups = report_index.summary(
+                    since=args.since, until=args.until)
+                out = sys.stdout if args.output == '-' else open(
+                    args.output, 'wt', newline='')
+                try:
+                    if args.format == 'json':
+                        json.dump(list(groups), out, indent=2)
+                        out.write('\n')
+                    else:
+                        writer = csv.DictWriter(out, SUMMARY_COLUMNS)
+                        writer.writeheader()
+                        writer.writerows(groups)
+                finally:
+                    if out is not sys.stdout:
+                        out.close()
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Output was piped to a command that exited early (e.g. head).
+        # Redirect stdout so the interpreter does not fail again on flush.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
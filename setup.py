@@ -11,6 +11,9 @@ setup(
     author_email='<steve email>, john.didion@nih.gov',
     license='MIT',
     packages = ['pytattle'],
+    entry_points = {
+        'console_scripts' : ['pytattle=pytattle.viewer:main']
+    },
     tests_require = ['pytest', 'pytest-cov'],
     extras_require = {
         'github' : ['github3']